@@ -4,21 +4,29 @@ import core.config
 from core.services.mqtt import MqttClient
 from PySide6.QtCore import QObject, Signal, Slot
 
+# Decode the admin pattern once at import rather than per controller
+try:
+    _admin_pattern = json.loads(os.getenv("BNB_ADMIN_PATTERN", "[]"))
+except json.JSONDecodeError:
+    _admin_pattern = None
+if isinstance(_admin_pattern, list):
+    ADMIN_PATTERN = tuple(_admin_pattern)
+else:
+    print("Warning: Invalid BNB_ADMIN_PATTERN environment variable.")
+    ADMIN_PATTERN = () # Default to empty if invalid
+
 class AdminController(QObject):
     openAdmin = Signal()
     notifyAdminUnlock = Signal()
     _input = list
-    _pattern = list
+    _pattern = tuple
+    _pattern_len = int
 
     def __init__(self):
         super().__init__()
         self._input = []
-        try:
-            # Load pattern during initialization
-            self._pattern = json.loads(os.getenv("BNB_ADMIN_PATTERN", "[]"))
-        except json.JSONDecodeError:
-            print("Warning: Invalid BNB_ADMIN_PATTERN environment variable.")
-            self._pattern = [] # Default to empty if invalid
+        self._pattern = ADMIN_PATTERN
+        self._pattern_len = len(ADMIN_PATTERN)
   
     @Slot(int)
     def pushInput(self, num):
@@ -27,8 +35,8 @@ class AdminController(QObject):
              return
         self._input.append(num)
         # Optional: Trim input if it gets longer than pattern
-        if len(self._input) > len(self._pattern):
-            self._input = self._input[-len(self._pattern):]
+        if len(self._input) > self._pattern_len:
+            self._input = self._input[-self._pattern_len:]
         self.checkSeq() # Check sequence after each input
 
     @Slot()
@@ -36,11 +44,14 @@ class AdminController(QObject):
         if not self._pattern:
             print("Admin pattern not configured.")
             return
-        if self._input == self._pattern:
+        # Only a full-length input can be compared against the pattern
+        if len(self._input) != self._pattern_len:
+            return
+        if tuple(self._input) == self._pattern:
             print("Admin pattern correct!")
             self.openAdmin.emit()
             self.notifyAdminUnlock.emit()
             self._input.clear()
-        elif len(self._input) == len(self._pattern):
+        else:
             print("Incorrect pattern.")
             self._input.clear()
\ No newline at end of file
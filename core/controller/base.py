@@ -6,7 +6,7 @@
 # will be used to interface with the model.
 #
 ###############################################################################
-from PySide6.QtCore import QObject, Slot, Property, Signal
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Qt, Slot, Property, Signal
 from PySide6.QtWidgets import QApplication
 from core.services.nfc import NFCListenerThread
 from core.model import Model, Cart, User
@@ -14,6 +14,27 @@ from core.database import get_user
 from . import CartController, CheckoutController, AdminController, TareController, DeviceController
 from core import database
 
+
+class _UserLookupTask(QRunnable):
+    """
+    Look up the user for an NFC token on a thread pool thread, so the request
+    doesn't block the UI. The result is emitted as (token, user or None).
+    """
+
+    def __init__(self, nfc_id: str, finished_signal):
+        super().__init__()
+        self._nfc_id = nfc_id
+        self._finished_signal = finished_signal
+
+    def run(self):
+        try:
+            user = database.get_user(nfc_id=self._nfc_id)
+        except Exception as e:
+            print(f"User lookup error: {e}")
+            user = None
+        self._finished_signal.emit(self._nfc_id, user)
+
+
 class Controller(QObject):
     _model: Model
     _cart: Cart
@@ -23,17 +44,20 @@ class Controller(QObject):
     _checkout_controller: CheckoutController
     _tare_controller: TareController
     _nfc_signal = Signal(str)
+    _user_lookup_finished = Signal(str, object)
 
     def __init__(self):
         super().__init__()
         self._nfc = NFCListenerThread()
         self._cart = Cart()
-        self._cart_controller = CartController(self._model._cart)
+        self._cart_controller = CartController(self._cart)
+        self._model = Model(self._cart_controller)
+        # Lookups finish on a pool thread; handle the result back on this one
+        self._user_lookup_finished.connect(self._on_user_lookup_finished, Qt.QueuedConnection)
         self._checkout_controller = CheckoutController(self._model)
         self._tare_controller = TareController(self._model._shelf_manager)
         self._admin_controller = AdminController()
         self._device_controller = DeviceController()
-        self._model = Model(self._cart_controller)
 
     @Property(QObject, constant=True)
     def admin(self):
@@ -84,7 +108,10 @@ class Controller(QObject):
     @Slot(str)
     def emit_nfc(self, msg):
         # print("recieved emitter: ", msg)
-        user = database.get_user(nfc_id=msg)
+        QThreadPool.globalInstance().start(_UserLookupTask(msg, self._user_lookup_finished))
+
+    @Slot(str, object)
+    def _on_user_lookup_finished(self, msg, user):
         # print("User: ", user)
         if(user == None):
             print("NO USER FOUND")
@@ -1,89 +1,177 @@
 import os
-from PySide6.QtCore import QAbstractListModel, Qt, QModelIndex, Slot
+from PySide6.QtCore import QAbstractListModel, Qt, QModelIndex, Signal, Slot
 from core.model import Cart
 
+# Absolute path to the UI images folder, resolved once at import
+_BASE_IMAGE_PATH = os.path.abspath(os.path.join(
+    os.path.dirname(__file__),  # Current file's directory (core/controller/)
+    "..", "..",  # Move up to project root
+    "ui", "images"  # Images folder
+))
+# Default placeholder path
+_PLACEHOLDER_IMAGE_PATH = os.path.join(_BASE_IMAGE_PATH, "placeholder.png")
+# Rows a batch of changes has to insert or remove before the model is reset
+# instead of signalling each row; smaller batches keep the views' state
+BATCH_RESET_MIN_ROW_CHANGES = 4
+
 class CartController(QAbstractListModel):
+    # Custom roles, computed once rather than as Qt.UserRole + n on every call
+    NAME_ROLE, PRICE_ROLE, QUANTITY_ROLE, IMAGE_ROLE = range(Qt.UserRole + 1, Qt.UserRole + 5)
+
+    _quantities_changed = Signal()
+    _updates_received = Signal(object, object)
+
     def __init__(self, cart: Cart):
         super().__init__()
         self.cart = cart
         self._image_cache = {}  # Cache for image paths
+        # Map each role to a getter taking (item, quantity), so data() does a
+        # single dict lookup instead of walking an if/elif chain per call
+        self._role_getters = {
+            Qt.DisplayRole: lambda item, quantity: f"{item.name} (x{quantity})",
+            self.NAME_ROLE: lambda item, quantity: item.name,
+            self.PRICE_ROLE: lambda item, quantity: item.price,
+            self.QUANTITY_ROLE: lambda item, quantity: quantity,
+            self.IMAGE_ROLE: lambda item, quantity: self._get_image_path(item),
+        }
+        # Items whose quantity changed since the last flush. The cart is only
+        # changed on this object's thread (shelf updates arrive through the
+        # queued applyUpdates()), so the set needs no lock. The flush is queued
+        # too, so every change made before it runs is covered by one dataChanged.
+        self._dirty_items = set()
+        self._quantities_changed.connect(self._flush_dirty_items, Qt.QueuedConnection)
+        # Batches of shelf changes are handed over from the shelf manager's
+        # thread and applied on this object's thread, in the order they arrive
+        self._updates_received.connect(self._apply_updates, Qt.QueuedConnection)
 
     def roleNames(self):
         return {
             Qt.DisplayRole: b"display",
-            Qt.UserRole + 1: b"name",
-            Qt.UserRole + 2: b"price",
-            Qt.UserRole + 3: b"quantity",
-            Qt.UserRole + 4: b"image"  # New role for image path
+            self.NAME_ROLE: b"name",
+            self.PRICE_ROLE: b"price",
+            self.QUANTITY_ROLE: b"quantity",
+            self.IMAGE_ROLE: b"image"  # New role for image path
         }
     
     def data(self, index, role=Qt.DisplayRole):
-        if not index.isValid() or index.row() >= len(self.cart.get_all_items()):
+        # Qt calls this once per role per visible row, so fetch the item list
+        # once and read the quantity straight off the cart's copy of the item
+        # rather than searching the cart for it again
+        items = self.cart.get_all_items()
+        if not index.isValid() or index.row() >= len(items):
             return None
-            
-        item = self.cart.get_all_items()[index.row()]
-        quantity = self.cart.get_quantity(item)
-        
-        if role == Qt.DisplayRole:
-            return f"{item.name} (x{quantity})"
-        elif role == Qt.UserRole + 1:  # name
-            return item.name
-        elif role == Qt.UserRole + 2:  # price
-            return item.price
-        elif role == Qt.UserRole + 3:  # quantity
-            return quantity
-        elif role == Qt.UserRole + 4:  # image
-            return self._get_image_path(item)
-        return None
+
+        getter = self._role_getters.get(role)
+        if getter is None:
+            return None
+        item = items[index.row()]
+        return getter(item, item.quantity)
     
     def _get_image_path(self, item):
-        # Get absolute path to images folder
-        base_path = os.path.abspath(os.path.join(
-            os.path.dirname(__file__),  # Current file's directory (models/)
-            "..",  # Move up to project root
-            "images"  # Images folder
-        ))
-        
-        # Default placeholder path
-        placeholder = os.path.join(base_path, "placeholder.png")
-        
-        # Check if item has valid image
-        if not hasattr(item, "image_path"):
-            return placeholder  # Returns: /Users/.../bits-n-bytes-ui/images/placeholder.png
-        
-        # Build item's image path
-        item_image = os.path.join(base_path, item.image_path)
-        return item_image if os.path.exists(item_image) else placeholder
+        # Resolve each item's image once; Qt asks for the image role on every
+        # repaint and the filesystem check is the expensive part
+        image_path = self._image_cache.get(item.item_id)
+        if image_path is None:
+            image_path = _PLACEHOLDER_IMAGE_PATH
+            # Check if item has valid image
+            if hasattr(item, "image_path"):
+                item_image = os.path.join(_BASE_IMAGE_PATH, item.image_path)
+                if os.path.exists(item_image):
+                    image_path = item_image
+            self._image_cache[item.item_id] = image_path
+        return image_path
 
     def rowCount(self, parent=QModelIndex()):
-        return len(self.cart.get_all_items())
+        return len(self.cart)
 
     def addItem(self, item):
-        if item not in self.cart.get_all_items():
+        if self.cart.get_index(item) is None:
             # Insert a new row if the item is not already in the cart
-            print(item.thumbnail_url)
             position = len(self.cart)
             self.beginInsertRows(QModelIndex(), position, position)
+            self.cart.add_item(item)
             self.endInsertRows()
         else:
             # Just update the existing item's quantity
-            position = self.cart.get_index(item)
-            top_left = self.index(position, 0)
-            self.dataChanged.emit(top_left, top_left, [Qt.DisplayRole])
+            self.cart.add_item(item)
+            self._mark_dirty(item)
 
     def removeItem(self, item):
-        if item in self.cart.items:
-            position = list(self.cart.items.keys()).index(item)
+        position = self.cart.get_index(item)
+        if position is None:
+            return
+        if self.cart.get_quantity(item) - item.quantity <= 0:
+            # Remove the row if quantity reaches 0
+            self.beginRemoveRows(QModelIndex(), position, position)
+            self.cart.remove_item(item)
+            self.endRemoveRows()
+        else:
+            # Just update the quantity
             self.cart.remove_item(item)
-            if self.cart.get_quantity(item) <= 0:
-                # Remove the row if quantity reaches 0
-                self.beginRemoveRows(QModelIndex(), position, position)
-                del self.cart.items[item]
-                self.endRemoveRows()
-            else:
-                # Just update the quantity
-                top_left = self.index(position, 0)
-                self.dataChanged.emit(top_left, top_left, [Qt.DisplayRole])
+            self._mark_dirty(item)
+
+    def applyUpdates(self, items_to_add, items_to_remove):
+        """
+        Apply a group of cart changes. This can be called from any thread; the
+        changes are applied on this object's thread.
+        :param items_to_add: List of Item, each with the quantity to add.
+        :param items_to_remove: List of Item, each with the quantity to remove.
+        :return: None
+        """
+        self._updates_received.emit(items_to_add, items_to_remove)
+
+    @Slot(object, object)
+    def _apply_updates(self, items_to_add, items_to_remove):
+        # Removing an item that isn't in the cart changes nothing. That's most of
+        # the burst when shelves first report in, so drop those up front.
+        items_to_remove = [item for item in items_to_remove if self.cart.get_index(item) is not None]
+        # Count the rows this batch inserts or removes
+        row_changes = sum(1 for item in items_to_add if self.cart.get_index(item) is None)
+        row_changes += sum(1 for item in items_to_remove if self.cart.get_quantity(item) - item.quantity <= 0)
+
+        if row_changes >= BATCH_RESET_MIN_ROW_CHANGES:
+            # Many rows come and go at once, so reset the model once instead of
+            # signalling every row
+            self.beginResetModel()
+            for item in items_to_add:
+                self.cart.add_item(item)
+            for item in items_to_remove:
+                self.cart.remove_item(item)
+            # The reset refreshes every row, including any waiting on a flush
+            self._dirty_items.clear()
+            self.endResetModel()
+        else:
+            # Row-level signals keep the views' delegates and scroll position, and
+            # quantity-only changes still coalesce into one dataChanged
+            for item in items_to_add:
+                self.addItem(item)
+            for item in items_to_remove:
+                self.removeItem(item)
+
+    def _mark_dirty(self, item):
+        """
+        Queue a quantity refresh for an item's row.
+        :param item: The Item whose quantity changed.
+        :return: None
+        """
+        flush_pending = len(self._dirty_items) > 0
+        self._dirty_items.add(item)
+        if not flush_pending:
+            self._quantities_changed.emit()
+
+    @Slot()
+    def _flush_dirty_items(self):
+        dirty_items = self._dirty_items
+        self._dirty_items = set()
+        # Items may have left the cart since they were marked
+        rows = [row for item in dirty_items if (row := self.cart.get_index(item)) is not None]
+        if rows:
+            # Only the quantity (and the display text built from it) changed
+            self.dataChanged.emit(
+                self.index(min(rows), 0),
+                self.index(max(rows), 0),
+                [Qt.DisplayRole, self.QUANTITY_ROLE]
+            )
 
     def clear(self):
         self.beginResetModel()
@@ -40,8 +40,8 @@ class CheckoutController(QObject):
              return
         
         items = list()
-        for item in self._model._cart._items:
-            item_dict = {key: value for key, value in item.__dict__.items() if key in ['name', 'price', 'quantity']}
+        for item in self._model._cart.get_all_items():
+            item_dict = {'name': item.name, 'price': item.price, 'quantity': item.quantity}
             items.append(item_dict)
         try:
             send_order_confirmation_email(self._email, items, self.subtotal)
@@ -65,7 +65,7 @@ class CheckoutController(QObject):
         client = Client(account_sid, auth_token)
 
         items = list()
-        for item in self._model._cart._items:
+        for item in self._model._cart.get_all_items():
             product = shorten_string(item.name, 16)
             items.append(f"{item.quantity} {product}   ${item.price:.2f}")
         
@@ -1,5 +1,4 @@
 import os
-import json
 import core.config
 from core.services.mqtt import MqttClient
 from PySide6.QtCore import QObject, Signal, Slot   
@@ -24,13 +23,6 @@ class DeviceController(QObject):
 
     def __init__(self):
         super().__init__()
-        self._input = []
-        try:
-            # Load pattern during initialization
-            self._pattern = json.loads(os.getenv("BNB_ADMIN_PATTERN", "[]"))
-        except json.JSONDecodeError:
-            print("Warning: Invalid BNB_ADMIN_PATTERN environment variable.")
-            self._pattern = [] # Default to empty if invalid
 
         if(MQTT_LOCAL_BROKER_URL is not None):
             self._mqttLocalClient = MqttClient(MQTT_LOCAL_BROKER_URL, 1883)
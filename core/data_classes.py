@@ -4,6 +4,12 @@ import copy
 WEIGHT_UNIT = 'g'
 
 class Item:
+    # Fixed attribute sets keep these small and quick to read; the whole
+    # catalog is held in memory as Items
+    __slots__ = (
+        'item_id', 'name', 'upc', 'price', 'quantity', 'avg_weight', 'std_weight',
+        'thumbnail_url', 'vision_class'
+    )
 
     def __init__(
             self, item_id, name, upc, price, quantity, avg_weight, std_weight,
@@ -21,7 +27,7 @@ class Item:
 
     def __str__(self):
         return (f'Item[{self.item_id},{self.name},UPC:{self.upc},${self.price},'
-                f'{self.units}units,{self.avg_weight}{WEIGHT_UNIT},'
+                f'{self.quantity}units,{self.avg_weight}{WEIGHT_UNIT},'
                 f'{self.std_weight}{WEIGHT_UNIT},{self.thumbnail_url},'
                 f'{self.vision_class}]')
 
@@ -36,6 +42,8 @@ class Item:
 
 
 class User:
+    __slots__ = ('uid', 'name', 'token', 'balance', 'payment_type', 'email', 'phone')
+
     def __init__(self, uid, name, token, balance, payment_type, email, phone):
         self.uid = uid
         self.name = name
@@ -47,20 +55,28 @@ class User:
 
 
 class NFC:
+    __slots__ = ('uid', 'assigned_user', 'type')
+
     def __init__(self, id, assigned_user, type):
         self.uid = id
         self.assigned_user = assigned_user
         self.type = type
 
     def __str__(self):
-        return (f'NFC[ID: {self.id}, UserID: {self.assigned_user}, Type: {self.type}]')
+        return (f'NFC[ID: {self.uid}, UserID: {self.assigned_user}, Type: {self.type}]')
 
 
 class Cart:
+    __slots__ = ('_items', '_row_index')
+
     _items: List[Item]
+    _row_index: Dict[Item, int]
 
     def __init__(self):
         self._items = list()
+        # Position of each item in _items, so callers (like the cart's Qt
+        # model) can find an item's row without scanning the list
+        self._row_index = dict()
 
     def add_item(self, item: Item) -> None:
         """
@@ -69,14 +85,17 @@ class Cart:
         :return: None
         """
         # Check if this item is in the cart already
-        if item in self._items:
+        index = self._row_index.get(item)
+        if index is not None:
             # It's in the cart, increment the existing instance's quantity
-            index = self._items.index(item)
             self._items[index].quantity += item.quantity
         else:
             # It's not in the cart, add it!
-            # This uses a copy of item to prevent modifying the object passed into this function
-            self._items.append(copy.deepcopy(item))
+            # This uses a copy of item to prevent modifying the object passed into this function.
+            # Every field is an immutable value, so a shallow copy is enough.
+            item_copy = copy.copy(item)
+            self._row_index[item_copy] = len(self._items)
+            self._items.append(item_copy)
 
     def remove_item(self, item: Item) -> None:
         """
@@ -87,8 +106,8 @@ class Cart:
         :return: None
         """
         # Check if the item is even in the cart
-        if item in self._items:
-            index = self._items.index(item)
+        index = self._row_index.get(item)
+        if index is not None:
             # Calculate the new quantity for the cart
             new_quantity = self._items[index].quantity - item.quantity
             if new_quantity > 0:
@@ -96,16 +115,18 @@ class Cart:
                 self._items[index].quantity = new_quantity
             else:
                 # If the quantity is 0 or negative, remove the item from the cart
-                self._items.remove(item)
+                del self._items[index]
+                del self._row_index[item]
+                # Only the items after the removed one changed position
+                for row in range(index, len(self._items)):
+                    self._row_index[self._items[row]] = row
 
     def get_index(self, item: Item) -> int:
         '''
         Get index for specific item in the cart
         :return: A integer for the index of item
         '''
-        if item in self._items:
-            return self._items.index(item)
-        return None
+        return self._row_index.get(item)
 
     def get_quantity(self, item: Item) -> int:
         '''
@@ -119,17 +140,22 @@ class Cart:
 
     def get_all_items(self) -> List[Item]:
         """
-        Get all items in the cart
+        Get all items in the cart, in the order they were added. This is the
+        cart's own list rather than a copy, so callers must not modify it.
         :return: A list of items in the cart
         """
         return self._items
 
+    def __len__(self) -> int:
+        return len(self._items)
+
     def clear_cart(self) -> None:
         """
         Clear all items from the cart.
         :return: None
         """
         self._items.clear()
+        self._row_index.clear()
 
     def get_subtotal(self) -> float:
         """
@@ -7,19 +7,30 @@
 # Purpose: Provide a connection to the database
 #
 ###############################################################################
+import copy
 import os
+import time
 import requests
+from requests.adapters import HTTPAdapter
 from typing import List
+from urllib3.util.retry import Retry
 import config
 from core.data_classes import *
 
 API_ENDPOINT = os.getenv("BNB_API_ENDPOINT", '')
+# Endpoint URLs, built once. Append an ID to the ones ending in '/'.
+ITEMS_URL = API_ENDPOINT + "/items"
+ITEM_URL = API_ENDPOINT + "/items/"
+USER_URL = API_ENDPOINT + "/users/"
+NFC_URL = API_ENDPOINT + "/nfc/"
 AUTHORIZATION_KEY = os.getenv("BNB_AUTHORIZATION_KEY", '')
 
 MOCK_ITEMS = {
     2: Item(2, "Sour Patch Kids", "567890123456", 3.50, 90, 226, 15, "images/item_placeholder.png", ""),
     3: Item(3, "Brownie Brittle", "", 3.00, 90, 78, 10, "images/item_placeholder.png", ""),
 }
+# List form of MOCK_ITEMS, built once for get_items()
+MOCK_ITEMS_LIST = list(MOCK_ITEMS.values())
 
 # [
 #     {
@@ -95,27 +106,64 @@ MOCK_NFC = {
 USE_MOCK_DB_DATA = os.getenv("USE_MOCK_DB_DATA", 'false').lower() == 'true'
 
 REQUEST_HEADERS = {"Authorization": AUTHORIZATION_KEY}
+REQUEST_TIMEOUT_S = 5
+# How long the result of is_reachable() is reused before checking again
+REACHABLE_CHECK_TTL_S = 5
+# How long a user looked up by NFC ID is reused before fetching it again
+NFC_USER_CACHE_TTL_S = 60
+
+# Shared session so requests reuse pooled connections instead of opening a new
+# one (and redoing the TCP/TLS handshake) every call
+session = requests.Session()
+session.headers.update(REQUEST_HEADERS)
+# Keep a few connections per host alive and retry once on connection errors
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=Retry(total=1))
+session.mount("http://", _adapter)
+session.mount("https://", _adapter)
 
 # Store a cached list of all items
 cached_items = None
 # Store a cached dictionary of items, accessible by ID
 cached_items_by_id = None
+# Store the last reachability check as (monotonic time, result)
+last_reachable_check = None
+# Store users looked up by NFC ID as {nfc id: (monotonic time, User)}
+cached_users_by_nfc_id = dict()
+
+
+def clear_cached_items() -> None:
+    """
+    Drop all cached items, so the next get_items()/get_item() call fetches
+    fresh data. Call this when the inventory changes.
+    :return: None
+    """
+    global cached_items, cached_items_by_id
+    cached_items = None
+    cached_items_by_id = None
+
 
 def is_reachable() -> bool:
     """
-    Check if the database is reachable
+    Check if the database is reachable. The result is reused for
+    REACHABLE_CHECK_TTL_S seconds so repeated checks don't each make a request.
     :return: True if the database is reachable, False otherwise
     """
+    global last_reachable_check
     if USE_MOCK_DB_DATA:
         return True
     else:
+        now = time.monotonic()
+        if last_reachable_check is not None and now - last_reachable_check[0] < REACHABLE_CHECK_TTL_S:
+            return last_reachable_check[1]
         print("Check If Reachable (GET)")
         try:
-            requests.get(API_ENDPOINT, headers=REQUEST_HEADERS)
-            return True
+            session.get(API_ENDPOINT, timeout=REQUEST_TIMEOUT_S)
+            reachable = True
         except requests.RequestException:
             print(f"\tExperienced Request Exception")
-            return False
+            reachable = False
+        last_reachable_check = (now, reachable)
+        return reachable
 
 
 def get_items() -> List[Item]:
@@ -127,13 +175,13 @@ def get_items() -> List[Item]:
 
     print("GET /items")
     if USE_MOCK_DB_DATA:
-        return list(MOCK_ITEMS.values())
+        return MOCK_ITEMS_LIST
     else:
         # Fetch data only if there is no cache
         if cached_items is None:
-            url = API_ENDPOINT + "/items"
+            url = ITEMS_URL
             # Make request
-            response = requests.get(url, headers={"Authorization": AUTHORIZATION_KEY})
+            response = session.get(url, timeout=REQUEST_TIMEOUT_S)
             # Check response code
             if response.status_code == 200:
                 # Create list of items
@@ -172,38 +220,44 @@ def get_item(item_id: int) -> Item | None:
     :return: An Item or None if the item does not exist
     """
     global cached_items_by_id
-    print(f"GET /items/{item_id}")
     if USE_MOCK_DB_DATA:
         if item_id in MOCK_ITEMS:
             return MOCK_ITEMS[item_id]
         else:
             return None
     else:
-        if cached_items_by_id is None:
-            url = API_ENDPOINT + f"/items/{item_id}"
-            # Make request
-            response = requests.get(url, headers=REQUEST_HEADERS)
-            # Check response code
-            if response.status_code == 200:
-                item = response.json()
-                return Item(
-                    item['id'],
-                    item['name'],
-                    item['upc'],
-                    item['price'],
-                    item['units'],
-                    item['avg_weight'],
-                    item['std_weight'],
-                    item['thumbnail'],
-                    item['vision_class']
-                )
-            else:
-                # Something went wrong so print info and return None
-                print(f"\tReceived response {response.status_code}:")
-                print(f"\t{response.content}")
-                return None
-        else:
+        # Serve from the cache when possible, so only unseen items cost a request
+        if cached_items_by_id is not None and item_id in cached_items_by_id:
             return cached_items_by_id[item_id]
+        # Only log actual requests; cache hits happen on every shelf prediction
+        print(f"GET /items/{item_id}")
+        url = ITEM_URL + str(item_id)
+        # Make request
+        response = session.get(url, timeout=REQUEST_TIMEOUT_S)
+        # Check response code
+        if response.status_code == 200:
+            item_raw = response.json()
+            item = Item(
+                item_raw['id'],
+                item_raw['name'],
+                item_raw['upc'],
+                item_raw['price'],
+                item_raw['units'],
+                item_raw['avg_weight'],
+                item_raw['std_weight'],
+                item_raw['thumbnail'],
+                item_raw['vision_class']
+            )
+            # Cache the item by ID
+            if cached_items_by_id is None:
+                cached_items_by_id = dict()
+            cached_items_by_id[item_id] = item
+            return item
+        else:
+            # Something went wrong so print info and return None
+            print(f"\tReceived response {response.status_code}:")
+            print(f"\t{response.content}")
+            return None
 
 
 
@@ -236,31 +290,41 @@ def get_user(user_id=None, nfc_id=None) -> User | None:
         else:
             return None
     else:
+        # An NFC lookup takes two requests, so reuse a recent result for this card.
+        # Callers edit the User they get back, so each hit returns its own copy.
+        if nfc_id is not None:
+            cached_user = cached_users_by_nfc_id.get(nfc_id)
+            if cached_user is not None:
+                if time.monotonic() - cached_user[0] < NFC_USER_CACHE_TTL_S:
+                    return copy.copy(cached_user[1])
+                # Expired, drop it
+                cached_users_by_nfc_id.pop(nfc_id, None)
+
         # Determine whether URL should query based on nfc ID or user ID
         url = ""
         if nfc_id is not None:
             # Query based on nfc id
             print(f"GET /nfc/{nfc_id}")
-            url = API_ENDPOINT + f"/nfc/{nfc_id}"
+            url = NFC_URL + str(nfc_id)
         elif user_id is not None:
             # Query based on user id
             print(f"GET /users/{user_id}")
-            url = API_ENDPOINT + f"/users/{user_id}"
+            url = USER_URL + str(user_id)
         else:
             # Neither so return None
             return None
 
         # Make query determined above
-        response = requests.get(url, headers=REQUEST_HEADERS)
+        response = session.get(url, timeout=REQUEST_TIMEOUT_S)
         # Check response code
         if response.status_code == 200:
             if nfc_id is not None:
                 UID = response.json()['assigned_user']
                 print(f"GET /users/{UID}")
-                url = API_ENDPOINT + f"/users/{UID}"
-                response = requests.get(url, headers=REQUEST_HEADERS)
+                url = USER_URL + str(UID)
+                response = session.get(url, timeout=REQUEST_TIMEOUT_S)
                 user = response.json()
-                return User(
+                user_obj = User(
                     user['id'],
                     user['name'],
                     user['thumb_img'],
@@ -268,7 +332,10 @@ def get_user(user_id=None, nfc_id=None) -> User | None:
                     user['email'],
                     user['phone']
                 )
-                    
+                # Cache a copy, so later edits to the returned User don't leak into the cache
+                cached_users_by_nfc_id[nfc_id] = (time.monotonic(), copy.copy(user_obj))
+                return user_obj
+
             if user_id is not None:
                 user = response.json()
                 return User(
@@ -300,7 +367,11 @@ def update_user(user: User) -> User | None:
         else:
             return None
     else:
-        url = API_ENDPOINT + f"/users/{user.uid}"
+        # Cached NFC lookups for this user are about to be out of date
+        for nfc_id, (_, cached_user) in list(cached_users_by_nfc_id.items()):
+            if cached_user.uid == user.uid:
+                cached_users_by_nfc_id.pop(nfc_id, None)
+        url = USER_URL + str(user.uid)
         params = {
             'id': user.uid,
             'name': user.name,
@@ -309,7 +380,7 @@ def update_user(user: User) -> User | None:
             'email': user.email,
             'phone': user.phone
         }
-        response = requests.put(url, params=params, headers=REQUEST_HEADERS)
+        response = session.put(url, params=params, timeout=REQUEST_TIMEOUT_S)
         if response == 200:
             return user
         else:
@@ -5,7 +5,7 @@
 # Purpose: Contains all model logic
 #
 ###############################################################################
-import copy
+import logging
 from typing import List, Set, Dict
 from core.services.shelf_manager import ShelfManager
 from core.data_classes import *
@@ -14,6 +14,8 @@ from core.controller.cart import CartController
 
 WEIGHT_UNIT = 'g'
 
+logger = logging.getLogger(__name__)
+
 
 class Model:
 
@@ -26,15 +28,19 @@ class Model:
     def __init__(self, cart_controller: CartController):
         db.get_items()
         self._current_user = None
-        self._cart = Cart()
+        # Share the cart controller's cart so the UI and model see the same items
+        self._cart = cart_controller.cart
 
         self._current_user = User(-1, 'Bilson McDade', '', 999.99, 'IMAGINE25', '', '')
         self._cart_controller = cart_controller
-        self._shelf_manager = ShelfManager(add_cart_item_cb=self.add_item_to_cart_cb, remove_cart_item_cb=self.remove_item_from_cart_cb)
+        self._shelf_manager = ShelfManager(
+            cart_batch_cb=self.update_cart_cb
+        )
 
     def get_all_items_in_cart(self) -> List[Item]:
         """
-        Get all items in the cart.
+        Get all items in the cart. This is the cart's own list rather than a copy,
+        so callers must not modify it.
         Returns: A list of items in the cart.
 
         """
@@ -47,7 +53,8 @@ class Model:
         Returns: None
 
         """
-        self._cart.clear_cart()
+        # The cart controller clears it so views attached to the cart are reset too
+        self._cart_controller.clear()
 
 
     def get_user_name(self) -> str | None:
@@ -127,14 +134,9 @@ class Model:
             # TODO update database
 
 
-    def add_item_to_cart_cb(self, item: Item) -> None:
-        print("added to cart")
-        self._cart.add_item(item)
-        self._cart_controller.addItem(item)
-
-
-    def remove_item_from_cart_cb(self, item: Item) -> None:
-        print("removed from cart")
-        self._cart.remove_item(item)
-        self._cart_controller.removeItem(item)
+    def update_cart_cb(self, items_to_add: List[Item], items_to_remove: List[Item]) -> None:
+        logger.debug("%d added to cart, %d removed from cart", len(items_to_add), len(items_to_remove))
+        # This runs on the shelf manager's thread, so hand the changes to the cart
+        # controller, which applies them on its own thread
+        self._cart_controller.applyUpdates(items_to_add, items_to_remove)
 
@@ -5,6 +5,9 @@ from smartcard.CardType import AnyCardType
 from PySide6.QtCore import QThread, Signal
 import threading
 
+# How long to wait before trying again after a failed scan (e.g. no reader attached)
+SCAN_RETRY_DELAY_MS = 500
+
 def scanCardUID():
 	readers = smartcard.System.readers()
 	print("selected reader: ", readers[0])
@@ -69,8 +72,10 @@ class NFCListenerThread(QThread):
 					self.token_detected.emit(token)  # Emit token when detected
 					self.running = False
 			except Exception as e:
-				pass
 				# print(f"Error in NFCListenerThread: {e}")
+				# Back off instead of retrying immediately, which would spin a core
+				# for as long as the reader is missing
+				self.msleep(SCAN_RETRY_DELAY_MS)
 
 	def stop(self):
 		self.running = False  # Set the flag to stop the loop
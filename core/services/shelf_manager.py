@@ -7,37 +7,63 @@
 # shelves.
 #
 ###############################################################################
+import copy
 import os
 import threading
 import time
 from json import JSONDecodeError
-from queue import Queue
+from collections import deque
 from threading import Lock
 from typing import List, Dict, Any, Callable
-from scipy.stats import norm
+from scipy.special import ndtr
 from pathlib import Path
 import json
 from filelock import FileLock
-import pandas as pd
+import numpy as np
 from core.services.mqtt import MqttClient
 from core.data_classes import *
 import core.database as db
 
+# orjson parses several times faster than the standard library, which matters
+# for shelf data since every shelf sends a message every few hundred ms. Its
+# JSONDecodeError subclasses json.JSONDecodeError, so error handling is the same.
+try:
+    import orjson as _json
+except ImportError:
+    _json = json
+
 SHELF_DATA_DIR = Path(Path.cwd() / 'tmp')
 SHELF_DISCONNECT_TIMEOUT_MS = 5000
+LOOP_DELAY_MS = 200
 DEFAULT_NUM_SLOTS_PER_SHELF = 4
 LOCAL_MQTT_BROKER_URL = os.environ.get('MQTT_LOCAL_BROKER_URL', None)
 REMOTE_MQTT_BROKER_URL = os.environ.get('MQTT_REMOTE_BROKER_URL', None)
 USE_MOCK_DATA = os.environ.get('USE_MOCK_DATA', False) == 'True'
 MAX_ITEM_REMOVALS_TO_CHECK = 5
 THRESHOLD_WEIGHT_PROBABILITY = 0.1
+# Weight changes smaller than this (in grams) are load cell noise, not an item
+# being moved, so they skip item prediction entirely
+MIN_WEIGHT_DELTA_G = 1.0
+# Quantities of an item that could be added/removed in a single weight change
+POTENTIAL_QUANTITIES = np.arange(1, MAX_ITEM_REMOVALS_TO_CHECK + 1)
+SHELF_DATA_TOPIC = 'shelf/data'
+# Shelves publish a full reading every few hundred ms, so a lost message is
+# replaced almost immediately. QoS 0 skips the PUBACK round trip that QoS 1
+# adds to every message on this, the busiest topic.
+SHELF_DATA_QOS = 0
 
 class Slot:
+    __slots__ = (
+        '_items', '_current_weight', '_previous_weight', '_conversion_factor',
+        '_expected_weights', '_scaled_stds'
+    )
 
     _items: List[Item]
     _current_weight: float
     _previous_weight: float
     _conversion_factor: float
+    _expected_weights: np.ndarray | None
+    _scaled_stds: np.ndarray | None
 
     def __init__(self, items: List[Item] | None = None, conversion_factor: float = 1):
         """
@@ -51,6 +77,9 @@ class Slot:
         self._current_weight = 0
         self._previous_weight = 0
         self._conversion_factor = conversion_factor
+        # Per item/quantity weight statistics, built on first use
+        self._expected_weights = None
+        self._scaled_stds = None
 
 
     def add_item(self, item: Item) -> None:
@@ -62,10 +91,12 @@ class Slot:
         if item in self._items:
             # Add quantity to existing item object
             item_index = self._items.index(item)
-            self._items[item_index] += item.quantity
+            self._items[item_index].quantity += item.quantity
         else:
             # Add new item object
             self._items.append(item)
+            self._expected_weights = None
+            self._scaled_stds = None
 
 
     def remove_item(self, item: Item) -> None:
@@ -83,6 +114,8 @@ class Slot:
             if new_quantity <= 0:
                 # Remove item completely
                 del self._items[item_index]
+                self._expected_weights = None
+                self._scaled_stds = None
             else:
                 # Decrease quantity
                 self._items[item_index].quantity = new_quantity
@@ -96,83 +129,55 @@ class Slot:
         Given a change in weight, predict the most likely item that could have
         been added/removed from this scale.
         :param weight_delta: Float weight change in grams
-        :return: Tuple: Item, Float; The item that is most likely and the probability of
-        it being that item.
+        :return: A list holding the most likely Item, with its quantity negative when taken off
+        the scale and positive when put back, or an empty list if no change is likely enough.
         """
         direction = 1
         if weight_delta < 0:
             direction = -1
 
-        # Store probabilities of the various quantities of items being added/removed from the slot
-        probabilities = dict()
-        # Iterate through all possible items
-        for item in self._items:
-            # Store probabilities
-            probabilities[item.item_id] = []
-            # Iterate through all possible quantities
-            for potential_quantity in range(1, MAX_ITEM_REMOVALS_TO_CHECK + 1):
-                expected_weight = item.avg_weight * potential_quantity
-                scaled_std = item.std_weight * (potential_quantity ** 0.5)
-                z_score = (abs(weight_delta) - expected_weight) / scaled_std
-                probability = (1 - abs(0.5 - norm.cdf(z_score)) * 2)
-
-                # # Calculate per-item weight at this quantity
-                # quantity_weight_delta = abs(weight_delta / potential_quantity)
-                # # Calculate probability using probability density function on bell curve
-                # probability = norm.pdf(
-                #     quantity_weight_delta,
-                #     loc=item.avg_weight,
-                #     scale=item.std_weight
-                # )
-                # Store this probability
-                probabilities[item.item_id].append(probability)
-        # Convert probabilities to pandas dataframe
-        df = pd.DataFrame(probabilities, index=range(1, MAX_ITEM_REMOVALS_TO_CHECK + 1)).T
-        # Convert to stack to get top n probabilities
-        probability_series = df.stack()
-        top_n = 1
-        top_n_probabilities = probability_series.nlargest(top_n)
-        items: List[Item] = list()
-        item_ids_and_quantities = dict()
-
-        # Iterate through the top probabilities in decreasing order
-        for rank, ((item_id, quantity), probability) in enumerate(top_n_probabilities.items(), start=1):
-            if probability < THRESHOLD_WEIGHT_PROBABILITY:
-                # If this probability is less than the threshold, all others will be too so return early
-                break
-            else:
-                # Probability is above the threshold, add this item/quantity combination as something that
-                # probably happened.
-                if item_id in item_ids_and_quantities:
-                    # Item id already exists, increase quantity
-                    item_ids_and_quantities[item_id] += (direction * quantity)
-                else:
-                    # Item id does not already exist, add this quantity
-                    item_ids_and_quantities[item_id] = (direction * quantity)
-
-        # Create item objects that represent each of the changes
-        for item_id in item_ids_and_quantities:
-            # Get the quantity for this item
-            quantity = item_ids_and_quantities[item_id]
-            # Get the existing item object
-            existing_item_obj = db.get_item(item_id)
-            # Create a new item object with this quantity, and add it to the list of items to be
-            # returned
-            items.append(
-                Item(
-                    item_id,
-                    existing_item_obj.name,
-                    existing_item_obj.upc,
-                    existing_item_obj.price,
-                    quantity,
-                    existing_item_obj.avg_weight,
-                    existing_item_obj.std_weight,
-                    existing_item_obj.thumbnail_url,
-                    existing_item_obj.vision_class
-                )
-            )
-        # Return resulting items, where the quantity matches the number predicted to be added/removed from the scale.
-        return items
+        if len(self._items) == 0:
+            return list()
+
+        # Score every item/quantity combination in one pass
+        expected_weights, scaled_stds = self._get_weight_grids()
+        z_scores = (abs(weight_delta) - expected_weights) / scaled_stds
+        # The z-scores are already standardized, so the plain standard normal CDF
+        # (ndtr) applies without going through scipy.stats argument handling
+        probabilities = 1 - np.abs(0.5 - ndtr(z_scores)) * 2
+
+        # Take the most likely combination. Ties go to the first item, then the
+        # smallest quantity.
+        item_index, quantity_index = np.unravel_index(np.argmax(probabilities), probabilities.shape)
+        if probabilities[item_index, quantity_index] < THRESHOLD_WEIGHT_PROBABILITY:
+            # Even the most likely change isn't likely enough
+            return list()
+
+        item_id = self._items[item_index].item_id
+        quantity = direction * int(POTENTIAL_QUANTITIES[quantity_index])
+        # Get the existing item object
+        existing_item_obj = db.get_item(item_id)
+        # Return a copy of the item where the quantity matches the number predicted to be added/removed
+        # from the scale.
+        item = copy.copy(existing_item_obj)
+        item.quantity = quantity
+        return [item]
+
+
+    def _get_weight_grids(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get the expected weight and scaled standard deviation of every item/quantity
+        combination in this slot. These only depend on which items are in the slot,
+        so they're computed once and rebuilt only after the items change.
+        :return: Tuple: expected weights, scaled standard deviations. Each has a row
+        per item and a column per entry in POTENTIAL_QUANTITIES.
+        """
+        if self._expected_weights is None:
+            avg_weights = np.array([item.avg_weight for item in self._items], dtype=float)[:, np.newaxis]
+            std_weights = np.array([item.std_weight for item in self._items], dtype=float)[:, np.newaxis]
+            self._expected_weights = avg_weights * POTENTIAL_QUANTITIES
+            self._scaled_stds = std_weights * np.sqrt(POTENTIAL_QUANTITIES)
+        return self._expected_weights, self._scaled_stds
 
 
     def update_weight(self, raw_value: float) -> List[Item]:
@@ -183,9 +188,11 @@ class Slot:
         """
         new_weight = raw_value * self._conversion_factor
         weight_delta = new_weight - self._current_weight
-        item_changes = self.predict_most_likely_item(weight_delta)
         self._current_weight = new_weight
-        return item_changes
+        if abs(weight_delta) < MIN_WEIGHT_DELTA_G:
+            # Nothing moved, which is the case for almost every reading
+            return list()
+        return self.predict_most_likely_item(weight_delta)
 
 
     def tare(self, calibration_weight_g: float) -> bool:
@@ -228,6 +235,7 @@ class Slot:
 
 
 class Shelf:
+    __slots__ = ('_mac_address', '_last_ping_ms', '_slots')
 
     _mac_address: str
     _last_ping_ms: float
@@ -235,7 +243,7 @@ class Shelf:
 
     def __init__(self, mac_address: str, slots_list: List[Slot] | None = None) -> None:
         # Set all members
-        self._last_ping_ms = time.time() * 1000
+        self._last_ping_ms = time.monotonic() * 1000
         self._mac_address = mac_address
 
         if slots_list is None:
@@ -315,24 +323,25 @@ class ShelfManager:
 
     _last_loop_ms: float
 
-    _signal_end_lock: Lock
-    _signal_end: bool
+    _stop_event: threading.Event
 
     _active_shelves_lock: Lock
     _active_shelves: Dict[str, Shelf]
 
     _local_mqtt_client: MqttClient | None
 
-    _weight_updates_queue: Queue
+    _weight_updates_queue: deque
 
     _add_cart_item_cb: Callable[[Item], None] | None
     _remove_cart_item_cb: Callable[[Item], None] | None
+    _cart_batch_cb: Callable[[List[Item], List[Item]], None] | None
 
     def __init__(
             self,
             shelf_data_dir: Path = SHELF_DATA_DIR,
             add_cart_item_cb: Callable[[Item], None] | None = None,
-            remove_cart_item_cb: Callable[[Item], None] | None = None
+            remove_cart_item_cb: Callable[[Item], None] | None = None,
+            cart_batch_cb: Callable[[List[Item], List[Item]], None] | None = None
     ) -> None:
 
         # Instantiate active shelves
@@ -345,20 +354,25 @@ class ShelfManager:
         self._shelf_data_dir.mkdir(parents=True, exist_ok=True)
 
         # Setup signal end system
-        self._signal_end_lock = Lock()
-        self._signal_end = False
+        self._stop_event = threading.Event()
 
-        # Set up weight queue system
-        self._weight_updates_queue = Queue()
+        # Set up weight queue system. A deque's append() and popleft() are atomic,
+        # so the MQTT thread and main loop can share it without a lock.
+        self._weight_updates_queue = deque()
 
-        # Setup add/remove cart item callbacks
+        # Setup add/remove cart item callbacks. These are called directly on the shelf
+        # manager's thread, so they're only for callers that aren't Qt objects; Qt
+        # models should take their changes through cart_batch_cb and a queued signal.
         self._add_cart_item_cb = add_cart_item_cb
         self._remove_cart_item_cb = remove_cart_item_cb
+        # Takes all of a loop's cart changes at once (items to add, items to remove).
+        # When set, it's used instead of the add/remove callbacks.
+        self._cart_batch_cb = cart_batch_cb
 
         # Connect to local MQTT broker
         if not (LOCAL_MQTT_BROKER_URL == "None" or LOCAL_MQTT_BROKER_URL == None or LOCAL_MQTT_BROKER_URL == ""):
             self._local_mqtt_client = MqttClient(LOCAL_MQTT_BROKER_URL, 1883)
-            self._local_mqtt_client.add_topic('shelf/data', self._shelf_data_received)
+            self._local_mqtt_client.add_topic(SHELF_DATA_TOPIC, self._shelf_data_received, qos=SHELF_DATA_QOS)
             self._local_mqtt_client.start()
         else:
             self._local_mqtt_client = None
@@ -385,8 +399,8 @@ class ShelfManager:
             if shelf_data_path.exists():
                 with open(shelf_data_path, 'rb') as file:
                     try:
-                        # Load the JSON
-                        json_data = json.load(file)
+                        # Load the JSON. Both parsers accept the raw bytes, so no decode is needed.
+                        json_data = _json.loads(file.read())
                         mac_address = json_data["macAddress"]
                         slots = list()
                         # Load all slots
@@ -401,17 +415,8 @@ class ShelfManager:
                                 quantity = item_json["quantity"]
                                 # Make a copy of the item and modify the quantity
                                 item_to_copy = db.get_item(item_id)
-                                item_obj = Item(
-                                    item_to_copy.item_id,
-                                    item_to_copy.name,
-                                    item_to_copy.upc,
-                                    item_to_copy.price,
-                                    quantity,
-                                    item_to_copy.avg_weight,
-                                    item_to_copy.std_weight,
-                                    item_to_copy.thumbnail_url,
-                                    item_to_copy.vision_class
-                                )
+                                item_obj = copy.copy(item_to_copy)
+                                item_obj.quantity = quantity
                                 items_list.append(item_obj)
                             slot_obj = Slot(items_list, conversion_factor)
                             slots_list.append(slot_obj)
@@ -444,8 +449,8 @@ class ShelfManager:
         Stop this shelf manager's main loop.
         :return: None.
         """
-        with self._signal_end_lock:
-            self._signal_end = True
+        # Also wakes the main loop so it doesn't sit out the rest of its delay
+        self._stop_event.set()
 
 
     def start_loop(self) -> None:
@@ -466,14 +471,8 @@ class ShelfManager:
         Index 0 and 1 are on the top row, then 2 and 3 on the 2nd row, then 4 and 5... etc.
         """
         # Compile a list of all shelves that are actively connected
-        all_shelves = list()
         with self._active_shelves_lock:
-            # Iterate through al shelves
-            for mac_address in self._active_shelves:
-                # Add each shelf to the list
-                shelf_obj = self._active_shelves[mac_address]
-                all_shelves.append(shelf_obj)
-        return all_shelves
+            return list(self._active_shelves.values())
 
 
     def tare_slot(self, shelf_id: str, slot_id: int, calibration_weight_g: float) -> bool:
@@ -486,8 +485,8 @@ class ShelfManager:
         """
         with self._active_shelves_lock:
             # Check if this shelf exists
-            if shelf_id in self._active_shelves:
-                shelf_obj = self._active_shelves[shelf_id]
+            shelf_obj = self._active_shelves.get(shelf_id)
+            if shelf_obj is not None:
                 # Tare the slot
                 return shelf_obj.tare_slot(slot_id, calibration_weight_g)
 
@@ -501,11 +500,11 @@ class ShelfManager:
         and sends those back to the shelf manager.
         :return:
         """
-        msg_received_ms = time.time() * 1000
+        msg_received_ms = time.monotonic() * 1000
 
         # Convert message to JSON
         try:
-            json_data = json.loads(message)
+            json_data = _json.loads(message)
         except JSONDecodeError:
             print("Shelf Manager: Error: Unable to decode shelf data message as JSON.")
             return
@@ -517,40 +516,50 @@ class ShelfManager:
             print("Shelf Manager: Error: 'id' field not in dictionary")
             return
 
-        # Update shelves with new data
+        # Convert all weight readings in one pass before taking the shelves lock.
+        # Readings that aren't numbers become None so their slot gets skipped.
+        data = json_data.get('data')
+        if isinstance(data, list):
+            # bool is a subclass of int, so JSON true/false has to be ruled out separately
+            raw_weights = [
+                float(w) if isinstance(w, (int, float)) and not isinstance(w, bool) else None
+                for w in data
+            ]
+        else:
+            raw_weights = None
+
+        # Check if this shelf is active
         with self._active_shelves_lock:
-            # Check if this shelf is active
-            if mac_address in self._active_shelves:
-                # TODO if item count changed, update the data file
-                shelf_obj = self._active_shelves[mac_address]
+            shelf_obj = self._active_shelves.get(mac_address)
+        if shelf_obj is None:
+            print(f"Shelf Manager: New shelf connected with ID '{mac_address}'")
+            # Shelf is not active, see if any info exists in storage. This reads a file
+            # and can query the database, so it's done without holding the shelves lock.
+            shelf_obj = self._load_shelf_data(mac_address)
+            if shelf_obj is None:
+                # Shelf not loaded, create a new one
+                shelf_obj = Shelf(mac_address, [Slot() for _ in range(DEFAULT_NUM_SLOTS_PER_SHELF)])
             else:
-                print(f"Shelf Manager: New shelf connected with ID '{mac_address}'")
-                # Shelf is not active, see if any info exists in storage
-                shelf_obj = self._load_shelf_data(mac_address)
-                if shelf_obj is None:
-                    # Shelf not loaded, create a new one
-                    shelf_obj = Shelf(mac_address, [Slot(), Slot(), Slot(), Slot()])
-                else:
-                    # Shelf is loaded
-                    print("\tSuccessfully loaded shelf data from file.")
-                    pass
-                # Add this shelf to active
-                self._active_shelves[mac_address] = shelf_obj
+                # Shelf is loaded
+                print("\tSuccessfully loaded shelf data from file.")
+
+        # Update shelves with new data
+        with self._active_shelves_lock:
+            # Add this shelf to active if it isn't already. If the shelf was added (or
+            # timed out) while the lock was released, this keeps whatever is current.
+            shelf_obj = self._active_shelves.setdefault(mac_address, shelf_obj)
+            # TODO if item count changed, update the data file
             # Update the last time shit shelf pinged
             shelf_obj.update_last_ping_time(msg_received_ms)
-            try:
-                data = json_data['data']
-            except KeyError:
-                print("Shelf Manager: Error: 'data' field not in dictionary")
+            if raw_weights is None:
+                print("Shelf Manager: Error: 'data' field missing or not a list")
                 return
-            # Update the weight values for all slots
-            all_slots = shelf_obj.get_all_slots()
-            for i, raw_weight in enumerate(data):
-                if isinstance(raw_weight, float):
-                    if i < len(all_slots):
-                        item_updates = all_slots[i].update_weight(raw_weight)
-                        for item in item_updates:
-                            self._weight_updates_queue.put(item)
+            # Update the weight values for all slots. zip stops at whichever is shorter,
+            # so extra readings or slots without a reading are skipped.
+            for slot, raw_weight in zip(shelf_obj.get_all_slots(), raw_weights):
+                if raw_weight is None:
+                    continue
+                self._weight_updates_queue.extend(slot.update_weight(raw_weight))
 
 
     def _main_loop(self):
@@ -562,24 +571,22 @@ class ShelfManager:
         print("Shelf Manager: Starting")
 
 
-        self._last_loop_ms = time.time() * 1000
+        self._last_loop_ms = time.monotonic() * 1000
 
         while True:
-            current_time_ms = time.time() * 1000
+            current_time_ms = time.monotonic() * 1000
 
             # Break out of loop if flag was set
-            with self._signal_end_lock:
-                if self._signal_end:
-                    with self._active_shelves_lock:
-                        for shelf_mac in self._active_shelves:
-                            self._save_shelf_data(self._active_shelves[shelf_mac])
-                    break
+            if self._stop_event.is_set():
+                with self._active_shelves_lock:
+                    for shelf_obj in self._active_shelves.values():
+                        self._save_shelf_data(shelf_obj)
+                break
 
             # Shelf watchdog. Remove shelves that haven't sent any data in a certain amount of time.
             macs_to_remove = list()
             with self._active_shelves_lock:
-                for shelf_mac in self._active_shelves:
-                    shelf_obj = self._active_shelves[shelf_mac]
+                for shelf_mac, shelf_obj in self._active_shelves.items():
                     if shelf_obj.get_last_ping_time() < current_time_ms - SHELF_DISCONNECT_TIMEOUT_MS:
                         # Shelf has timed out, needs to be removed
                         print(f"Shelf Manager: Shelf '{shelf_mac}' disconnected (timed out).")
@@ -593,17 +600,39 @@ class ShelfManager:
                     del self._active_shelves[mac_address]
                 macs_to_remove.clear()
 
-            # Process item updates from queue
-            while not self._weight_updates_queue.empty():
+            # Process item updates from queue. Updates to the same item are netted
+            # together first, so each item gets at most one cart callback per loop.
+            net_updates: Dict[Item, Item] = dict()
+            while self._weight_updates_queue:
                 # Get next update to process
-                item_to_update: Item = self._weight_updates_queue.get()
+                item_to_update: Item = self._weight_updates_queue.popleft()
+                pending_update = net_updates.get(item_to_update)
+                if pending_update is None:
+                    net_updates[item_to_update] = item_to_update
+                else:
+                    pending_update.quantity += item_to_update.quantity
+
+            items_to_add = list()
+            items_to_remove = list()
+            for item_to_update in net_updates.values():
                 if item_to_update.quantity < 0:
-                    # Add to cart
+                    # Taken off the shelf, add to cart
                     item_to_update.quantity *= -1
+                    items_to_add.append(item_to_update)
+                elif item_to_update.quantity > 0:
+                    # Put back on the shelf, remove from cart
+                    items_to_remove.append(item_to_update)
+
+            if self._cart_batch_cb is not None:
+                # Hand the whole loop's changes over at once, so the cart can apply them
+                # together on its own thread
+                if items_to_add or items_to_remove:
+                    self._cart_batch_cb(items_to_add, items_to_remove)
+            else:
+                for item_to_update in items_to_add:
                     if self._add_cart_item_cb is not None:
                         self._add_cart_item_cb(item_to_update)
-                elif item_to_update.quantity > 0:
-                    # Remove from cart
+                for item_to_update in items_to_remove:
                     if self._remove_cart_item_cb is not None:
                         self._remove_cart_item_cb(item_to_update)
 
@@ -613,3 +642,9 @@ class ShelfManager:
             # Update time
             self._last_loop_ms = current_time_ms
 
+            # Sleep until the next iteration is due. Waiting on the stop event
+            # yields the CPU instead of spinning, and returns early on stop.
+            remaining_ms = self._last_loop_ms + LOOP_DELAY_MS - time.monotonic() * 1000
+            if remaining_ms > 0:
+                self._stop_event.wait(remaining_ms / 1000)
+
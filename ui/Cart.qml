@@ -45,6 +45,8 @@ Rectangle {
         focus: true
         highlightFollowsCurrentItem: true
         model: controller.cart
+        cacheBuffer: 400 // Keep delegates just outside the view alive
+        reuseItems: true
 
         delegate: CartItemDelegate {
             itemName: model.name
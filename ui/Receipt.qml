@@ -225,6 +225,8 @@ Rectangle {
             highlightFollowsCurrentItem: true
             clip: true
             model: controller.cart
+            cacheBuffer: 400 // Keep delegates just outside the view alive
+            reuseItems: true
             z: 1 // Ensures ListView is on top of the Rectangle
 
             delegate: CartItemDelegate {